@@ -0,0 +1,14 @@
+// Replaces the search service worker once it has been disabled, so browsers
+// that registered it drop the cached assets on their next update check.
+// CACHE_PREFIX is prepended by the search plugin at build time.
+
+self.addEventListener("install", () => self.skipWaiting());
+
+self.addEventListener("activate", (event) => {
+  event.waitUntil(
+    caches.keys().then((keys) => Promise.all(
+      keys.filter((key) => key.startsWith(CACHE_PREFIX))
+        .map((key) => caches.delete(key))
+    )).then(() => self.registration.unregister())
+  );
+});
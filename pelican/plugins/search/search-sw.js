@@ -0,0 +1,74 @@
+// Service worker caching the search index and Stork WebAssembly runtime.
+// CACHE_PREFIX and MANIFEST are prepended by the search plugin at build time.
+
+const CACHE_NAME = CACHE_PREFIX + MANIFEST.version;
+const ASSETS = [MANIFEST.index, MANIFEST.wasm]
+  .filter((asset) => asset.url)
+  .map((asset) => ({ ...asset, url: new URL(asset.url, self.location).href }));
+const URLS = ASSETS.map((asset) => asset.url);
+
+function toHex(buffer) {
+  return Array.from(new Uint8Array(buffer))
+    .map((byte) => byte.toString(16).padStart(2, "0"))
+    .join("");
+}
+
+// Reject failed responses and any asset that is not the one this worker was
+// built for, such as a stale copy served from the HTTP cache.
+function verify(url, response) {
+  if (!response.ok) {
+    return Promise.reject(new Error("Failed to fetch " + url));
+  }
+  const asset = ASSETS.find((candidate) => candidate.url === url);
+  if (!asset || !asset.sha256) {
+    return Promise.resolve(response);
+  }
+  return response.clone().arrayBuffer().then((buffer) =>
+    crypto.subtle.digest("SHA-256", buffer).then((digest) => {
+      if (buffer.byteLength !== asset.size || toHex(digest) !== asset.sha256) {
+        throw new Error(url + " does not match the search manifest");
+      }
+      return response;
+    })
+  );
+}
+
+self.addEventListener("install", (event) => {
+  event.waitUntil(
+    caches.open(CACHE_NAME).then((cache) => Promise.all(URLS.map((url) =>
+      fetch(new Request(url, { cache: "reload" }))
+        .then((response) => verify(url, response))
+        .then((response) => cache.put(url, response))
+    ))).then(() => self.skipWaiting())
+  );
+});
+
+self.addEventListener("activate", (event) => {
+  event.waitUntil(
+    caches.keys().then((keys) => Promise.all(
+      keys.filter((key) => key.startsWith(CACHE_PREFIX) && key !== CACHE_NAME)
+        .map((key) => caches.delete(key))
+    )).then(() => self.clients.claim())
+  );
+});
+
+self.addEventListener("fetch", (event) => {
+  const url = new URL(event.request.url);
+  url.search = "";
+  if (event.request.method !== "GET" || !URLS.includes(url.href)) {
+    return;
+  }
+  event.respondWith(
+    caches.open(CACHE_NAME).then((cache) =>
+      cache.match(url.href).then((cached) => cached || fetch(event.request)
+        .then((response) => {
+          event.waitUntil(
+            verify(url.href, response.clone())
+              .then((verified) => cache.put(url.href, verified))
+              .catch(() => undefined)
+          );
+          return response;
+        }))
+    )
+  );
+});
@@ -3,19 +3,32 @@
 Copyright (c) Justin Mayer
 """
 
+import hashlib
+import json
 import logging
 from pathlib import Path
 from shutil import which
 import subprocess
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
 
 from jinja2.filters import do_striptags as striptags
+from markupsafe import Markup
 import rtoml
 
 from pelican import signals
 
 logger = logging.getLogger(__name__)
 
+SEARCH_INDEX_FILENAME = "search-index.st"
+SEARCH_MANIFEST_FILENAME = "search-manifest.json"
+SEARCH_SERVICE_WORKER_FILENAME = "search-sw.js"
+DEFAULT_WASM_URL = "https://files.stork-search.net/releases/v1.5.0/stork.wasm"
+
+SERVICE_WORKER_CACHE_PREFIX = "pelican-search-"
+SERVICE_WORKER_SCRIPT = Path(__file__).parent / "search-sw.js"
+UNREGISTER_SERVICE_WORKER_SCRIPT = Path(__file__).parent / "search-sw-unregister.js"
+
 
 class SearchSettingsGenerator:
     """Generate site search settings."""
@@ -27,6 +40,8 @@ class SearchSettingsGenerator:
         self.tpages = settings.get("TEMPLATE_PAGES")
         self.input_options = settings.get("STORK_INPUT_OPTIONS", {})
         self.output_options = settings.get("STORK_OUTPUT_OPTIONS")
+        self.wasm_url = settings.get("SEARCH_WASM_URL", DEFAULT_WASM_URL)
+        self.service_worker = settings.get("SEARCH_SERVICE_WORKER", False)
         # Set default values
         self.input_options.setdefault("html_selector", "main")
         self.input_options.setdefault("base_directory", self.output_path)
@@ -51,6 +66,29 @@ class SearchSettingsGenerator:
             if settings.get("SEARCH_MODE") == "source":
                 self.input_options["base_directory"] = self.content
 
+    def generate_context(self):
+        self.context["SEARCH_INDEX_URL"] = SEARCH_INDEX_FILENAME
+        self.context["SEARCH_PRELOAD"] = self.get_preload_tags
+        self.context["SEARCH_SERVICE_WORKER_URL"] = (
+            SEARCH_SERVICE_WORKER_FILENAME
+            if self.service_worker and self.service_worker != "unregister"
+            else None
+        )
+
+    def get_preload_tags(self, siteurl: str = "") -> Markup:
+        """Return ``<link rel="preload">`` tags for the index and WASM runtime."""
+        urls = [f"{siteurl}/{SEARCH_INDEX_FILENAME}"]
+        if self.wasm_url:
+            wasm_url = self.wasm_url
+            # Relative runtime URLs are relative to the site root
+            if not (urlsplit(wasm_url).scheme or wasm_url.startswith("/")):
+                wasm_url = f"{siteurl}/{wasm_url}"
+            urls.append(wasm_url)
+        return Markup("\n").join(
+            Markup('<link rel="preload" href="{}" as="fetch" crossorigin>').format(url)
+            for url in urls
+        )
+
     def generate_output(self, writer):
         search_settings_path = Path(self.output_path) / "search.toml"
 
@@ -61,6 +99,17 @@ class SearchSettingsGenerator:
         build_log = "".join(["Search plugin reported ", build_log])
         logger.error(build_log) if "error" in build_log else logger.debug(build_log)
 
+        index_path = Path(self.output_path) / SEARCH_INDEX_FILENAME
+        if not index_path.exists():
+            logger.debug("Search index not found at %s", index_path)
+            return
+
+        # The index is built from the rendered output, so these are not
+        # available to templates, only to plugins running after this one
+        size, digest = get_file_metadata(index_path)
+        self.context["SEARCH_INDEX_SIZE"] = size
+        self.context["SEARCH_INDEX_HASH"] = digest
+
     def build_search_index(self, search_settings_path: Path):
         if not which("stork"):
             raise Exception("Stork must be installed and available on $PATH.")
@@ -72,7 +121,7 @@ class SearchSettingsGenerator:
                     "--input",
                     str(search_settings_path),
                     "--output",
-                    f"{self.output_path}/search-index.st",
+                    f"{self.output_path}/{SEARCH_INDEX_FILENAME}",
                 ],
                 capture_output=True,
                 encoding="utf-8",
@@ -133,6 +182,102 @@ class SearchSettingsGenerator:
         return input_files
 
 
+def get_file_metadata(path: Path) -> Tuple[int, str]:
+    """Return the size and SHA-256 hex digest of a file."""
+    data = path.read_bytes()
+    return len(data), hashlib.sha256(data).hexdigest()
+
+
+def get_local_path(output_path: Path, url: str) -> Optional[Path]:
+    """Return the output file served at a site-relative URL, if any."""
+    if not url or urlsplit(url).scheme or url.startswith("//"):
+        return None
+    path = output_path / urlsplit(url).path.lstrip("/")
+    return path if path.is_file() else None
+
+
+def get_search_manifest(output_path: Path, wasm_url: str) -> Optional[Dict]:
+    """Describe the assets cached by the service worker."""
+    index_path = output_path / SEARCH_INDEX_FILENAME
+    if not index_path.exists():
+        return None
+
+    index_size, index_digest = get_file_metadata(index_path)
+    wasm_size, wasm_digest = None, None
+    wasm_path = get_local_path(output_path, wasm_url)
+    if wasm_path:
+        wasm_size, wasm_digest = get_file_metadata(wasm_path)
+    elif wasm_url and not urlsplit(wasm_url).scheme:
+        logger.warning(
+            "Search plugin could not find %s in the output directory; "
+            "include a version in SEARCH_WASM_URL so runtime upgrades "
+            "invalidate the service worker cache",
+            wasm_url,
+        )
+
+    # Rotate the cache key whenever any cached asset changes
+    version = hashlib.sha256(
+        f"{index_digest}{wasm_url}{wasm_digest or ''}".encode()
+    ).hexdigest()
+    return {
+        "version": version[:16],
+        "index": {
+            "url": SEARCH_INDEX_FILENAME,
+            "size": index_size,
+            "sha256": index_digest,
+        },
+        "wasm": {"url": wasm_url, "size": wasm_size, "sha256": wasm_digest},
+    }
+
+
+def write_service_worker(worker_path: Path, script: Path, **constants):
+    """Write a worker script, prefixed with the given JavaScript constants."""
+    header = "".join(
+        f"const {name} = {json.dumps(value, indent=2)};\n"
+        for name, value in constants.items()
+    )
+    with worker_path.open("w", encoding="utf-8") as fd:
+        fd.write(header)
+        fd.write(script.read_text(encoding="utf-8"))
+
+
+def generate_service_worker(pelican):
+    """Write the search service worker once static files are in place."""
+    mode = pelican.settings.get("SEARCH_SERVICE_WORKER", False)
+    output_path = Path(pelican.output_path)
+    worker_path = output_path / SEARCH_SERVICE_WORKER_FILENAME
+    manifest_path = output_path / SEARCH_MANIFEST_FILENAME
+
+    # Deleting the worker would leave existing registrations in place, so
+    # replace it with one that clears the caches and unregisters itself
+    if mode == "unregister" or (not mode and worker_path.exists()):
+        write_service_worker(
+            worker_path,
+            UNREGISTER_SERVICE_WORKER_SCRIPT,
+            CACHE_PREFIX=SERVICE_WORKER_CACHE_PREFIX,
+        )
+        manifest_path.unlink(missing_ok=True)
+        return
+    if not mode:
+        return
+
+    manifest = get_search_manifest(
+        output_path, pelican.settings.get("SEARCH_WASM_URL", DEFAULT_WASM_URL)
+    )
+    if manifest is None:
+        logger.debug("Search index not found in %s", output_path)
+        return
+
+    with manifest_path.open("w", encoding="utf-8") as fd:
+        json.dump(manifest, fd, indent=2)
+    write_service_worker(
+        worker_path,
+        SERVICE_WORKER_SCRIPT,
+        CACHE_PREFIX=SERVICE_WORKER_CACHE_PREFIX,
+        MANIFEST=manifest,
+    )
+
+
 def get_generators(generators):
     """Get the search settings generator."""
     return SearchSettingsGenerator
@@ -141,3 +286,4 @@ def get_generators(generators):
 def register():
     """Register the plugin."""
     signals.get_generators.connect(get_generators)
+    signals.finalized.connect(generate_service_worker)
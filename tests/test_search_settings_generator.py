@@ -1,12 +1,21 @@
+import hashlib
+import json
 import logging
 import os
 from pathlib import Path
+import shutil
+from types import SimpleNamespace
 
 import chardet
 import pytest
 from pytest_mock import MockerFixture
 
-from pelican.plugins.search.search import SearchSettingsGenerator
+from pelican.plugins.search.search import (
+    SERVICE_WORKER_SCRIPT,
+    UNREGISTER_SERVICE_WORKER_SCRIPT,
+    SearchSettingsGenerator,
+    generate_service_worker,
+)
 
 
 class TestSearchSettingsGenerator:
@@ -121,6 +130,244 @@ class TestSearchSettingsGenerator:
                 for record in caplog.records:
                     assert record.levelname == "ERROR"
 
+    class TestGenerateContext:
+        def test_context_variables(self):
+            context = {}
+            generator = SearchSettingsGenerator(
+                context=context,
+                settings={},
+                path=None,
+                theme=None,
+                output_path="output",
+            )
+            generator.generate_context()
+            assert context["SEARCH_INDEX_URL"] == "search-index.st"
+            assert "SEARCH_INDEX_SIZE" not in context
+            assert "SEARCH_INDEX_HASH" not in context
+            assert context["SEARCH_SERVICE_WORKER_URL"] is None
+            assert context["SEARCH_PRELOAD"]("..") == (
+                '<link rel="preload" href="../search-index.st" as="fetch" crossorigin>'
+                "\n"
+                '<link rel="preload" '
+                'href="https://files.stork-search.net/releases/v1.5.0/stork.wasm" '
+                'as="fetch" crossorigin>'
+            )
+
+        @pytest.mark.parametrize(
+            "wasm_url, expected",
+            [
+                ("theme/js/stork.wasm", "https://example.com/theme/js/stork.wasm"),
+                ("/theme/js/stork.wasm", "/theme/js/stork.wasm"),
+            ],
+        )
+        def test_preload_relative_wasm_url(self, wasm_url: str, expected: str):
+            context = {}
+            generator = SearchSettingsGenerator(
+                context=context,
+                settings={"SEARCH_WASM_URL": wasm_url},
+                path=None,
+                theme=None,
+                output_path="output",
+            )
+            generator.generate_context()
+            assert f'href="{expected}"' in context["SEARCH_PRELOAD"](
+                "https://example.com"
+            )
+
+        @pytest.mark.parametrize(
+            "service_worker, expected",
+            [(True, "search-sw.js"), (False, None), ("unregister", None)],
+        )
+        def test_service_worker_url(self, service_worker, expected):
+            context = {}
+            generator = SearchSettingsGenerator(
+                context=context,
+                settings={
+                    "SEARCH_SERVICE_WORKER": service_worker,
+                    "SEARCH_WASM_URL": "",
+                },
+                path=None,
+                theme=None,
+                output_path="output",
+            )
+            generator.generate_context()
+            assert context["SEARCH_SERVICE_WORKER_URL"] == expected
+            assert "wasm" not in context["SEARCH_PRELOAD"]("")
+
+    class TestIndexMetadata:
+        @pytest.fixture(autouse=True)
+        def mock_build(self, mocker: MockerFixture):
+            mocker.patch(
+                "pelican.plugins.search.SearchSettingsGenerator.generate_stork_settings"
+            )
+            mocker.patch(
+                "pelican.plugins.search.SearchSettingsGenerator.build_search_index",
+                return_value="",
+            )
+
+        def generate(self, output_path):
+            context = {}
+            generator = SearchSettingsGenerator(
+                context=context,
+                settings={},
+                path=None,
+                theme=None,
+                output_path=str(output_path),
+            )
+            generator.generate_context()
+            assert "SEARCH_INDEX_SIZE" not in context
+            assert "SEARCH_INDEX_HASH" not in context
+            generator.generate_output(writer=None)
+            return context
+
+        def test_set_after_build(self, tmp_path):
+            index = b"stork index"
+            (tmp_path / "search-index.st").write_bytes(index)
+            context = self.generate(tmp_path)
+            assert context["SEARCH_INDEX_SIZE"] == len(index)
+            assert context["SEARCH_INDEX_HASH"] == hashlib.sha256(index).hexdigest()
+
+        def test_index_missing(self, tmp_path):
+            context = self.generate(tmp_path)
+            assert "SEARCH_INDEX_SIZE" not in context
+            assert "SEARCH_INDEX_HASH" not in context
+
+    class TestServiceWorker:
+        def generate(self, output_path, settings):
+            generate_service_worker(
+                SimpleNamespace(settings=settings, output_path=str(output_path))
+            )
+
+        def read_constants(self, script):
+            """Parse the constants prepended to a generated worker script."""
+            constants = {}
+            decoder = json.JSONDecoder()
+            while script.startswith("const "):
+                name, script = script[len("const ") :].split(" = ", 1)
+                constants[name], end = decoder.raw_decode(script)
+                assert script[end : end + 2] == ";\n"
+                script = script[end + 2 :]
+            return constants, script
+
+        @pytest.mark.parametrize("service_worker", [True, False])
+        def test_manifest_and_worker(self, tmp_path, service_worker: bool):
+            index = b"stork index"
+            (tmp_path / "search-index.st").write_bytes(index)
+            self.generate(
+                tmp_path,
+                {
+                    "SEARCH_SERVICE_WORKER": service_worker,
+                    "SEARCH_WASM_URL": "https://cdn.example.com/v1/stork.wasm",
+                },
+            )
+            assert (tmp_path / "search-sw.js").exists() is service_worker
+            assert (tmp_path / "search-manifest.json").exists() is service_worker
+            if not service_worker:
+                return
+
+            digest = hashlib.sha256(index).hexdigest()
+            version = hashlib.sha256(
+                f"{digest}https://cdn.example.com/v1/stork.wasm".encode()
+            ).hexdigest()
+            manifest = json.loads((tmp_path / "search-manifest.json").read_text())
+            assert manifest == {
+                "version": version[:16],
+                "index": {
+                    "url": "search-index.st",
+                    "size": len(index),
+                    "sha256": digest,
+                },
+                "wasm": {
+                    "url": "https://cdn.example.com/v1/stork.wasm",
+                    "size": None,
+                    "sha256": None,
+                },
+            }
+            constants, body = self.read_constants(
+                (tmp_path / "search-sw.js").read_text()
+            )
+            assert constants == {
+                "CACHE_PREFIX": "pelican-search-",
+                "MANIFEST": manifest,
+            }
+            assert body == SERVICE_WORKER_SCRIPT.read_text()
+
+        def test_local_wasm_is_hashed(self, tmp_path):
+            (tmp_path / "search-index.st").write_bytes(b"stork index")
+            wasm_path = tmp_path / "theme" / "js" / "stork.wasm"
+            wasm_path.parent.mkdir(parents=True)
+            settings = {
+                "SEARCH_SERVICE_WORKER": True,
+                "SEARCH_WASM_URL": "theme/js/stork.wasm",
+            }
+            versions = []
+            for wasm in [b"stork 1.5.0", b"stork 1.6.0"]:
+                wasm_path.write_bytes(wasm)
+                self.generate(tmp_path, settings)
+                manifest = json.loads((tmp_path / "search-manifest.json").read_text())
+                assert manifest["wasm"] == {
+                    "url": "theme/js/stork.wasm",
+                    "size": len(wasm),
+                    "sha256": hashlib.sha256(wasm).hexdigest(),
+                }
+                versions.append(manifest["version"])
+            assert versions[0] != versions[1]
+
+        def test_missing_local_wasm_warns(self, tmp_path, caplog):
+            (tmp_path / "search-index.st").write_bytes(b"stork index")
+            self.generate(
+                tmp_path,
+                {"SEARCH_SERVICE_WORKER": True, "SEARCH_WASM_URL": "/js/stork.wasm"},
+            )
+            assert "could not find /js/stork.wasm" in caplog.text
+
+        def test_version_changes_with_wasm_url(self, tmp_path):
+            (tmp_path / "search-index.st").write_bytes(b"stork index")
+            versions = []
+            for wasm_url in [
+                "https://a/v1.5.0/stork.wasm",
+                "https://a/v1.6.0/stork.wasm",
+            ]:
+                self.generate(
+                    tmp_path,
+                    {"SEARCH_SERVICE_WORKER": True, "SEARCH_WASM_URL": wasm_url},
+                )
+                manifest = json.loads((tmp_path / "search-manifest.json").read_text())
+                versions.append(manifest["version"])
+            assert versions[0] != versions[1]
+
+        def assert_unregister_worker(self, output_path):
+            constants, body = self.read_constants(
+                (output_path / "search-sw.js").read_text()
+            )
+            assert constants == {"CACHE_PREFIX": "pelican-search-"}
+            assert body == UNREGISTER_SERVICE_WORKER_SCRIPT.read_text()
+            assert not (output_path / "search-manifest.json").exists()
+
+        def test_disabled_after_enabled(self, tmp_path):
+            (tmp_path / "search-index.st").write_bytes(b"stork index")
+            self.generate(tmp_path, {"SEARCH_SERVICE_WORKER": True})
+            self.generate(tmp_path, {"SEARCH_SERVICE_WORKER": False})
+            self.assert_unregister_worker(tmp_path)
+
+        def test_unregister_after_output_cleaned(self, tmp_path):
+            output_path = tmp_path / "output"
+            output_path.mkdir()
+            (output_path / "search-index.st").write_bytes(b"stork index")
+            self.generate(output_path, {"SEARCH_SERVICE_WORKER": True})
+
+            # DELETE_OUTPUT_DIRECTORY or a fresh checkout leaves no old worker
+            shutil.rmtree(output_path)
+            output_path.mkdir()
+            (output_path / "search-index.st").write_bytes(b"stork index")
+            self.generate(output_path, {"SEARCH_SERVICE_WORKER": "unregister"})
+            self.assert_unregister_worker(output_path)
+
+        def test_index_missing(self, tmp_path):
+            self.generate(tmp_path, {"SEARCH_SERVICE_WORKER": True})
+            assert not (tmp_path / "search-sw.js").exists()
+            assert not (tmp_path / "search-manifest.json").exists()
+
     class TestBuildSearchIndex:
         @pytest.mark.skip("Skipped because mocking is not working")
         def test_raise_exception_if_stork_not_there(self, mocker: MockerFixture):